@@ -5,21 +5,293 @@ from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QRadioButton, QGroupBox, QTableWidget,
     QTableWidgetItem, QProgressBar, QMessageBox, QButtonGroup,
-    QCheckBox, QHeaderView, QScrollArea
+    QCheckBox, QHeaderView, QScrollArea, QSpinBox, QFormLayout,
+    QSystemTrayIcon, QMenu, QAction, QStyle
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QColor
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QColor, QIcon
 import os
 import configparser
+import json
+import socket
+import ssl
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from pip_monitor import STORE_DIR, PASSIVE_MIN_SAMPLES, load_passive_stats
+
+# IPv4/IPv6 分别测速
+FAMILY_NAMES = {socket.AF_INET: "IPv4", socket.AF_INET6: "IPv6"}
+FAMILY_SLOW_RATIO = 1.5  # 默认地址族的延迟超过另一地址族的该倍数视为走了慢路径
+FAMILY_SLOW_MIN_DIFF = 50  # 同时要求延迟差至少为该值(毫秒)
+# 提供单一地址族专用域名的镜像站，可用来绕开较慢的地址族
+FAMILY_MIRRORS = {
+    "清华大学（TUNA）": {
+        socket.AF_INET: "https://mirrors4.tuna.tsinghua.edu.cn/pypi/web/simple/",
+        socket.AF_INET6: "https://mirrors6.tuna.tsinghua.edu.cn/pypi/web/simple/",
+    },
+    "中国科学技术大学（USTC）": {
+        socket.AF_INET: "https://ipv4.mirrors.ustc.edu.cn/pypi/simple/",
+        socket.AF_INET6: "https://ipv6.mirrors.ustc.edu.cn/pypi/simple/",
+    },
+}
+
+# 测速模式
+PROBE_MODE_SINGLE = "single"  # 每次新建连接发送一个HEAD请求
+PROBE_MODE_SESSION = "session"  # 复用同一会话连续请求，模拟pip的真实行为
+# 会话测速请求的项目页面：顺序请求和并发请求各用一组体积较小的常用包
+SESSION_SEQUENTIAL_PACKAGES = ["six", "idna", "certifi", "wheel", "packaging", "colorama"]
+SESSION_CONCURRENT_PACKAGES = ["attrs", "click", "pyparsing", "toml", "tomli", "zipp", "mccabe", "pluggy"]
+SESSION_WORKERS = 4  # 并发请求的线程数
+SESSION_AMORTIZE_REQUESTS = 100  # 按一次解析约100个包计算摊销延迟
+
+# 后台托盘模式
+AGENT_CONFIG_PATH = os.path.join(STORE_DIR, "agent.json")
+AGENT_DEFAULTS = {
+    "interval_minutes": 30,  # 定时重新测速的间隔(分钟)
+    "margin_percent": 30,  # 其他源需比当前源快多少(%)才算胜出
+    "rounds": 3,  # 连续多少轮不健康或被超越才切换
+}
+AGENT_TICK_SECONDS = 10  # 检查网络变化和定时任务的间隔(秒)
+AGENT_MIN_PROBE_GAP = 5 * 60  # 两次测速之间的最小间隔(秒)，用于限制探测频率
+DEFAULT_INDEX_URL = "https://pypi.org/simple/"  # 未配置时pip使用的源
+
+
+def load_agent_settings():
+    """读取后台托盘模式的设置，缺失或损坏时使用默认值"""
+    settings = dict(AGENT_DEFAULTS)
+    try:
+        with open(AGENT_CONFIG_PATH, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        for key in AGENT_DEFAULTS:
+            if isinstance(saved.get(key), int):
+                settings[key] = saved[key]
+    except (OSError, ValueError):
+        pass
+    return settings
+
+
+def save_agent_settings(settings):
+    """保存后台托盘模式的设置"""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(AGENT_CONFIG_PATH, "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+
+
+def get_network_fingerprint():
+    """获取当前网络环境的特征(默认路由和DNS服务器)，用于检测网络切换，仅支持Linux"""
+    if not sys.platform.startswith("linux"):
+        return None
+    routes = []
+    nameservers = []
+    try:
+        with open("/proc/net/route", "r") as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                # 目标地址为00000000的是默认路由：记录网卡和网关
+                if len(fields) > 2 and fields[1] == "00000000":
+                    routes.append((fields[0], fields[2]))
+    except OSError:
+        pass
+    try:
+        with open("/proc/net/ipv6_route", "r") as f:
+            for line in f:
+                fields = line.split()
+                # 目标为::/0的是IPv6默认路由：记录网卡和下一跳，跳过lo上的不可达路由
+                if (len(fields) > 9 and fields[0] == "0" * 32 and fields[1] == "00"
+                        and fields[9] != "lo"):
+                    routes.append((fields[9], fields[4]))
+    except OSError:
+        pass
+    try:
+        with open("/etc/resolv.conf", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1 and fields[0] == "nameserver":
+                    nameservers.append(fields[1])
+    except OSError:
+        pass
+    return tuple(sorted(routes)), tuple(nameservers)
+
+
+def get_default_family(host, port=443):
+    """获取系统连接该主机时首先尝试的地址族，解析失败返回None"""
+    try:
+        return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][0]
+    except (socket.gaierror, IndexError):
+        return None
+
+
+def family_connection_class(base, family):
+    """生成只通过指定地址族建立TCP连接的urllib3连接类"""
+    class FamilyConnection(base):
+        def _new_conn(self):
+            timeout = self.timeout if isinstance(self.timeout, (int, float)) else None
+            error = None
+            for af, socktype, proto, _, address in socket.getaddrinfo(
+                    self._dns_host, self.port, family, socket.SOCK_STREAM):
+                sock = socket.socket(af, socktype, proto)
+                try:
+                    for option in self.socket_options or []:
+                        sock.setsockopt(*option)
+                    sock.settimeout(timeout)
+                    sock.connect(address)
+                    return sock
+                except OSError as e:
+                    error = e
+                    sock.close()
+            raise error or OSError(f"没有{FAMILY_NAMES[family]}地址: {self._dns_host}")
+
+    return FamilyConnection
+
+
+class FamilyAdapter(requests.adapters.HTTPAdapter):
+    """只通过指定地址族连接的传输适配器，只影响挂载了它的会话，不改变进程中的其他连接"""
+    def __init__(self, family, *args, **kwargs):
+        self.family = family
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("FamilyHTTPConnectionPool", (HTTPConnectionPool,),
+                         {"ConnectionCls": family_connection_class(HTTPConnection, self.family)}),
+            "https": type("FamilyHTTPSConnectionPool", (HTTPSConnectionPool,),
+                          {"ConnectionCls": family_connection_class(HTTPSConnection, self.family)}),
+        }
+
+
+def probe_family(url, family, timeout=5):
+    """强制使用指定地址族测试镜像站延迟(毫秒)，连接失败返回-1，没有该地址族的解析记录返回None"""
+    parsed = urlparse(url)
+    try:
+        socket.getaddrinfo(parsed.hostname, parsed.port or 443, family, socket.SOCK_STREAM)
+    except socket.gaierror:
+        return None
+
+    session = requests.Session()
+    adapter = FamilyAdapter(family)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    try:
+        start_time = time.time()
+        response = session.head(url, timeout=timeout, allow_redirects=True)
+        end_time = time.time()
+    except Exception:
+        return -1
+    finally:
+        session.close()
+    if response.status_code >= 400:
+        return -1
+    return (end_time - start_time) * 1000
+
+
+def get_faster_family(family_result):
+    """判断默认地址族是否为慢路径，是则返回更快的地址族，否则返回None"""
+    default = family_result.get("default")
+    if default not in FAMILY_NAMES:
+        return None
+    other = socket.AF_INET6 if default == socket.AF_INET else socket.AF_INET
+    default_delay = family_result.get(default)
+    other_delay = family_result.get(other)
+    if other_delay is None or other_delay <= 0:
+        return None
+    if default_delay is None or default_delay <= 0:
+        return other
+    if default_delay > other_delay * FAMILY_SLOW_RATIO and default_delay - other_delay > FAMILY_SLOW_MIN_DIFF:
+        return other
+    return None
+
+
+def check_http2(host, port=443, timeout=5):
+    """通过TLS的ALPN协商检查服务器是否支持HTTP/2，无法连接时返回None"""
+    context = ssl.create_default_context()
+    context.set_alpn_protocols(["h2", "http/1.1"])
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=host) as tls_sock:
+                return tls_sock.selected_alpn_protocol() == "h2"
+    except (OSError, ssl.SSLError):
+        return None
+
+
+def count_pool_connections(adapter):
+    """统计适配器连接池中累计新建的连接数"""
+    pools = adapter.poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+def probe_session(url, timeout=5):
+    """复用同一会话测试镜像站：冷启动请求、顺序热请求、并发请求、长连接和HTTP/2支持，
+    返回结果字典，其中amortized为按SESSION_AMORTIZE_REQUESTS个请求摊销后的每请求延迟(毫秒)，失败为-1"""
+    result = {"cold": -1, "warm": -1, "concurrent": -1, "amortized": -1,
+              "keep_alive": None, "http2": None, "errors": 0}
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=SESSION_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    def fetch(package):
+        """请求一个项目页面并读取完整内容，返回耗时(毫秒)，失败返回-1"""
+        try:
+            start_time = time.perf_counter()
+            response = session.get(f"{url.rstrip('/')}/{package}/", timeout=timeout)
+            _ = response.content  # 读取完整响应体
+            end_time = time.perf_counter()
+        except Exception:
+            return -1
+        if response.status_code >= 400:
+            return -1
+        return (end_time - start_time) * 1000
+
+    try:
+        # 冷启动：包含DNS解析、TCP和TLS握手
+        result["cold"] = fetch(SESSION_SEQUENTIAL_PACKAGES[0])
+        if result["cold"] <= 0:
+            return result
+        cold_connections = count_pool_connections(adapter)
+
+        # 顺序热请求：支持长连接时不应再新建连接
+        warm = [fetch(package) for package in SESSION_SEQUENTIAL_PACKAGES[1:]]
+        warm_ok = [delay for delay in warm if delay > 0]
+        result["errors"] += len(warm) - len(warm_ok)
+        result["keep_alive"] = count_pool_connections(adapter) == cold_connections
+        if not warm_ok:
+            return result
+        result["warm"] = statistics.median(warm_ok)
+
+        # 并发请求：按总耗时折算每请求延迟
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=SESSION_WORKERS) as executor:
+            burst = list(executor.map(fetch, SESSION_CONCURRENT_PACKAGES))
+        burst_ok = [delay for delay in burst if delay > 0]
+        result["errors"] += len(burst) - len(burst_ok)
+        if burst_ok:
+            result["concurrent"] = (time.perf_counter() - start_time) * 1000 / len(burst_ok)
+    finally:
+        session.close()
+
+    result["amortized"] = (result["cold"] + result["warm"] * (SESSION_AMORTIZE_REQUESTS - 1)) / SESSION_AMORTIZE_REQUESTS
+    parsed = urlparse(url)
+    result["http2"] = check_http2(parsed.hostname, parsed.port or 443, timeout)
+    return result
+
 
 class PingThread(QThread):  # 修复了类名错误，移除了重复的PingThread
     """用于测试镜像站延迟的线程类"""
     update_signal = pyqtSignal(str, str, float)  # 发送更新信号 (名称, URL, 延迟)
+    family_signal = pyqtSignal(str, object)  # 发送分地址族测速结果 (名称, {地址族: 延迟, "default": 默认地址族})
+    session_signal = pyqtSignal(str, object)  # 发送会话测速结果 (名称, probe_session的结果字典)
     finish_signal = pyqtSignal()  # 发送完成信号
 
-    def __init__(self, mirrors):
+    def __init__(self, mirrors, per_family=False, mode=PROBE_MODE_SINGLE):
         super().__init__()
         self.mirrors = mirrors
+        self.per_family = per_family  # 是否分别测试IPv4和IPv6
+        self.mode = mode  # 测速模式
         self.running = True
 
     def run(self):
@@ -27,20 +299,31 @@ class PingThread(QThread):  # 修复了类名错误，移除了重复的PingThre
         for name, url in self.mirrors.items():
             if not self.running:
                 break
-            try:
-                start_time = time.time()
-                # 发送HEAD请求测试连接
-                response = requests.head(url, timeout=5, allow_redirects=True)
-                end_time = time.time()
-                
-                # 计算延迟(毫秒)
-                if response.status_code < 400:
-                    delay = (end_time - start_time) * 1000
-                    self.update_signal.emit(name, url, delay)
-                else:
-                    self.update_signal.emit(name, url, -1)  # 状态码错误
-            except Exception:
-                self.update_signal.emit(name, url, -1)  # 连接失败
+            if self.per_family:
+                family_result = {"default": get_default_family(urlparse(url).hostname)}
+                for family in FAMILY_NAMES:
+                    family_result[family] = probe_family(url, family)
+                self.family_signal.emit(name, family_result)
+            if self.mode == PROBE_MODE_SESSION:
+                # 会话模式以摊销后的每请求延迟作为排序依据
+                session_result = probe_session(url)
+                self.session_signal.emit(name, session_result)
+                self.update_signal.emit(name, url, session_result["amortized"])
+            else:
+                try:
+                    start_time = time.time()
+                    # 发送HEAD请求测试连接
+                    response = requests.head(url, timeout=5, allow_redirects=True)
+                    end_time = time.time()
+
+                    # 计算延迟(毫秒)
+                    if response.status_code < 400:
+                        delay = (end_time - start_time) * 1000
+                        self.update_signal.emit(name, url, delay)
+                    else:
+                        self.update_signal.emit(name, url, -1)  # 状态码错误
+                except Exception:
+                    self.update_signal.emit(name, url, -1)  # 连接失败
             time.sleep(0.1)  # 避免请求过于密集
         self.finish_signal.emit()
 
@@ -67,8 +350,24 @@ class PipSourceManager(QMainWindow):
             "Python官方": "https://pypi.org/simple/"
         }
         self.delays = []  # 存储延迟测试结果
+        self.passive_stats = {}  # 真实pip安装产生的被动测速统计(按主机)
+        self.family_results = {}  # IPv4/IPv6分别测速的结果(按镜像站名称)
+        self.session_results = {}  # 会话复用测速的结果(按镜像站名称)
         self.multi_mirror_checkboxes = {}  # 多源选择框字典
         self.base_font_size = 10  # 基础字体大小
+        self.agent_settings = load_agent_settings()  # 后台托盘模式设置
+        self.agent_running = False
+        self.agent_probing = False
+        self.agent_delays = []  # 后台测速结果，与界面上的测速结果分开保存
+        self.agent_family_results = {}  # 后台测速的IPv4/IPv6结果，只在同一网络环境下有效
+        self.agent_probe_network = None  # 本轮后台测速开始时的网络特征
+        self.agent_bad_rounds = 0  # 当前源连续不健康或被超越的轮数
+        self.agent_last_probe = 0
+        self.agent_pending_reason = None  # 因频率限制而推迟的测速原因
+        self.agent_network = None
+        self.tray_icon = None
+        self.agent_timer = QTimer(self)
+        self.agent_timer.timeout.connect(self.agent_tick)
         self.init_ui()
 
     def init_ui(self):
@@ -128,6 +427,22 @@ class PipSourceManager(QMainWindow):
         self.test_button.setMinimumSize(300, 30)  # 宽度300，高度30
         panel_layout.addWidget(self.test_button)
 
+        # 测速模式选择
+        probe_mode_layout = QHBoxLayout()
+        self.single_probe_radio = QRadioButton("单次请求（含握手）")
+        self.single_probe_radio.setChecked(True)
+        self.session_probe_radio = QRadioButton("会话复用（模拟pip，按摊销延迟排序）")
+        self.session_probe_radio.setToolTip(
+            f"每个镜像站复用一个连接池，依次和并发请求多个项目页面，"
+            f"按解析{SESSION_AMORTIZE_REQUESTS}个包摊销冷启动开销")
+        self.probe_mode_group = QButtonGroup(self)
+        self.probe_mode_group.addButton(self.single_probe_radio)
+        self.probe_mode_group.addButton(self.session_probe_radio)
+        probe_mode_layout.addWidget(self.single_probe_radio)
+        probe_mode_layout.addWidget(self.session_probe_radio)
+        probe_mode_layout.addStretch(1)
+        panel_layout.addLayout(probe_mode_layout)
+
         # 进度条
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
@@ -135,14 +450,18 @@ class PipSourceManager(QMainWindow):
 
         # 测速结果表格
         self.mirror_table = QTableWidget()
-        self.mirror_table.setColumnCount(3)
+        self.mirror_table.setColumnCount(8)
         # 修复拼写错误：setHorizontaladerLabels -> setHorizontalHeaderLabels
-        self.mirror_table.setHorizontalHeaderLabels(["镜像站名称", "镜像站地址", "延迟(ms)"])
+        self.mirror_table.setHorizontalHeaderLabels(
+            ["镜像站名称", "镜像站地址", "延迟(ms)", "IPv4(ms)", "IPv6(ms)",
+             "冷启动/热请求(ms)", "长连接/HTTP2", "实际安装(被动)"])
         self.mirror_table.setEditTriggers(QTableWidget.NoEditTriggers)  # 禁止编辑
         # 表格列宽设置
         self.mirror_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
         self.mirror_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.mirror_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
+        for column in range(3, 8):
+            self.mirror_table.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeToContents)
         self.mirror_table.setAlternatingRowColors(True)  # 隔行变色
         panel_layout.addWidget(self.mirror_table)
 
@@ -232,6 +551,34 @@ class PipSourceManager(QMainWindow):
         button_layout.addWidget(self.view_config_button)
         panel_layout.addLayout(button_layout)
 
+        # 后台托盘模式
+        agent_group = QGroupBox("后台托盘模式（自动切换）")
+        agent_layout = QFormLayout(agent_group)
+
+        self.agent_interval_spin = QSpinBox()
+        self.agent_interval_spin.setRange(5, 24 * 60)
+        self.agent_interval_spin.setSuffix(" 分钟")
+        self.agent_interval_spin.setValue(self.agent_settings["interval_minutes"])
+        agent_layout.addRow("定时测速间隔:", self.agent_interval_spin)
+
+        self.agent_margin_spin = QSpinBox()
+        self.agent_margin_spin.setRange(0, 90)
+        self.agent_margin_spin.setSuffix(" %")
+        self.agent_margin_spin.setValue(self.agent_settings["margin_percent"])
+        agent_layout.addRow("领先幅度阈值:", self.agent_margin_spin)
+
+        self.agent_rounds_spin = QSpinBox()
+        self.agent_rounds_spin.setRange(1, 10)
+        self.agent_rounds_spin.setSuffix(" 轮")
+        self.agent_rounds_spin.setValue(self.agent_settings["rounds"])
+        agent_layout.addRow("连续轮数:", self.agent_rounds_spin)
+
+        self.agent_button = QPushButton("启动后台托盘模式")
+        self.agent_button.clicked.connect(self.toggle_tray_mode)
+        self.agent_button.setMinimumSize(200, 30)
+        agent_layout.addRow(self.agent_button)
+        panel_layout.addWidget(agent_group)
+
         # 当前设置显示
         current_label = QLabel("当前配置:")
         panel_layout.addWidget(current_label)
@@ -268,7 +615,7 @@ class PipSourceManager(QMainWindow):
         # 为目标按钮设置更大的字体
         button_font = QFont("SimHei", font_size + 2, QFont.Bold)  # 比普通字体大2号并加粗
         for btn in [self.test_button, self.apply_button, 
-                   self.reset_button, self.view_config_button]:
+                   self.reset_button, self.view_config_button, self.agent_button]:
             btn.setFont(button_font)
         
         # 调整其他元素字体
@@ -284,6 +631,9 @@ class PipSourceManager(QMainWindow):
         control_font = QFont("SimHei", font_size)
         for radio in self.single_mirror_buttons.values():
             radio[0].setFont(control_font)
+
+        self.single_probe_radio.setFont(control_font)
+        self.session_probe_radio.setFont(control_font)
         
         for checkbox in self.multi_mirror_checkboxes.values():
             checkbox[0].setFont(control_font)
@@ -304,6 +654,12 @@ class PipSourceManager(QMainWindow):
     def start_test(self):
         """开始测试所有镜像站延迟"""
         self.delays.clear()
+        self.family_results.clear()
+        self.session_results.clear()
+        try:
+            self.passive_stats = load_passive_stats()
+        except OSError:
+            self.passive_stats = {}
         self.mirror_table.setRowCount(0)
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
@@ -311,7 +667,18 @@ class PipSourceManager(QMainWindow):
         self.test_button.setEnabled(False)
 
         # 创建并启动测试线程
-        self.ping_thread = PingThread(self.mirrors)
+        if self.session_probe_radio.isChecked():
+            probe_mode = PROBE_MODE_SESSION
+            self.mirror_table.horizontalHeaderItem(2).setText("摊销延迟(ms)")
+        else:
+            probe_mode = PROBE_MODE_SINGLE
+            self.mirror_table.horizontalHeaderItem(2).setText("延迟(ms)")
+        self.single_probe_radio.setEnabled(False)
+        self.session_probe_radio.setEnabled(False)
+
+        self.ping_thread = PingThread(self.mirrors, per_family=True, mode=probe_mode)
+        self.ping_thread.family_signal.connect(self.update_family_result)
+        self.ping_thread.session_signal.connect(self.update_session_result)
         self.ping_thread.update_signal.connect(self.update_delay)
         self.ping_thread.finish_signal.connect(self.test_finished)
         self.ping_thread.start()
@@ -319,11 +686,38 @@ class PipSourceManager(QMainWindow):
     def update_delay(self, name, url, delay):
         """更新单个镜像站的延迟信息"""
         self.delays.append((name, url, delay))
-        self.delays.sort(key=lambda x: x[2] if x[2] > 0 else float('inf'))
+        self.delays.sort(key=self.rank_key)
         self.update_table()
         progress = int(len(self.delays) / len(self.mirrors) * 100)
         self.progress_bar.setValue(progress)
 
+    def update_family_result(self, name, family_result):
+        """保存单个镜像站的IPv4/IPv6测速结果"""
+        self.family_results[name] = family_result
+
+    def update_session_result(self, name, session_result):
+        """保存单个镜像站的会话复用测速结果"""
+        self.session_results[name] = session_result
+
+    def get_passive_stats(self, url):
+        """获取镜像站对应主机的被动测速统计，样本不足时返回None"""
+        stats = self.passive_stats.get(urlparse(url).hostname)
+        if stats and stats["count"] >= PASSIVE_MIN_SAMPLES:
+            return stats
+        return None
+
+    def rank_key(self, item):
+        """排序依据：主动探测延迟，有足够被动记录时与真实安装的首字节时间取平均并按错误率加权"""
+        name, url, delay = item
+        if delay <= 0:
+            return float('inf')
+        stats = self.get_passive_stats(url)
+        if not stats:
+            return delay
+        if stats["ttfb"] <= 0:
+            return float('inf')  # 真实安装中的请求全部失败
+        return (delay + stats["ttfb"]) / 2 / max(0.01, 1 - stats["error_rate"])
+
     def update_table(self):
         """更新表格内容，保持排序状态"""
         self.mirror_table.setRowCount(0)
@@ -356,20 +750,86 @@ class PipSourceManager(QMainWindow):
                 delay_item.setForeground(QColor(128, 128, 128))
                 self.mirror_table.setItem(row, 2, delay_item)
 
+            family_result = self.family_results.get(name, {})
+            fast_family = get_faster_family(family_result)
+            for column, family in [(3, socket.AF_INET), (4, socket.AF_INET6)]:
+                family_delay = family_result.get(family)
+                if family not in family_result:
+                    family_item = QTableWidgetItem("-")
+                elif family_delay is None:
+                    family_item = QTableWidgetItem("无地址")
+                elif family_delay > 0:
+                    family_item = QTableWidgetItem(f"{family_delay:.2f}")
+                else:
+                    family_item = QTableWidgetItem("无法连接")
+                if family_result.get("default") == family:
+                    family_item.setText(family_item.text() + " (默认)")
+                    if fast_family is not None:
+                        family_item.setForeground(QColor(255, 0, 0))
+                        family_item.setToolTip(f"系统默认使用{FAMILY_NAMES[family]}连接该镜像站，"
+                                               f"但{FAMILY_NAMES[fast_family]}更快")
+                elif family_delay is None or family_delay <= 0:
+                    family_item.setForeground(QColor(128, 128, 128))
+                family_item.setTextAlignment(Qt.AlignVCenter | Qt.AlignRight)
+                self.mirror_table.setItem(row, column, family_item)
+
+            session_result = self.session_results.get(name)
+            if session_result is None:
+                cold_item = QTableWidgetItem("-")
+                reuse_item = QTableWidgetItem("-")
+            else:
+                cold = f"{session_result['cold']:.2f}" if session_result["cold"] > 0 else "失败"
+                warm = f"{session_result['warm']:.2f}" if session_result["warm"] > 0 else "失败"
+                cold_item = QTableWidgetItem(f"{cold} / {warm}")
+                concurrent = (f"{session_result['concurrent']:.2f} ms" if session_result["concurrent"] > 0
+                              else "失败")
+                cold_item.setToolTip(f"冷启动请求(含握手) / 顺序热请求中位数\n"
+                                     f"并发({SESSION_WORKERS}线程)每请求: {concurrent}\n"
+                                     f"失败请求数: {session_result['errors']}")
+                flags = {True: "支持", False: "不支持", None: "未知"}
+                reuse_item = QTableWidgetItem(
+                    f"{flags[session_result['keep_alive']]} / {flags[session_result['http2']]}")
+                reuse_item.setToolTip("长连接：热请求是否复用了冷启动建立的连接\n"
+                                      "HTTP2：服务器是否通过ALPN协商HTTP/2（pip目前只使用HTTP/1.1）")
+                if session_result["keep_alive"] is False:
+                    reuse_item.setForeground(QColor(255, 0, 0))
+            for column, item in [(5, cold_item), (6, reuse_item)]:
+                item.setTextAlignment(Qt.AlignVCenter | Qt.AlignRight)
+                self.mirror_table.setItem(row, column, item)
+
+            stats = self.get_passive_stats(url)
+            if stats:
+                ttfb_text = f"{stats['ttfb']:.2f} ms" if stats["ttfb"] > 0 else "全部失败"
+                passive_item = QTableWidgetItem(
+                    f"{ttfb_text} / {stats['count']}次 / 错误{stats['error_rate']:.0%}")
+                passive_item.setToolTip(f"首字节时间中位数 / 请求数 / 错误率\n"
+                                        f"总耗时中位数: {stats['total']:.2f} ms\n"
+                                        f"下载量: {stats['bytes'] / 1024 / 1024:.2f} MB")
+            else:
+                passive_item = QTableWidgetItem("无记录")
+                passive_item.setForeground(QColor(128, 128, 128))
+            passive_item.setTextAlignment(Qt.AlignVCenter | Qt.AlignRight)
+            self.mirror_table.setItem(row, 7, passive_item)
+
     def test_finished(self):
         """测试完成后的处理"""
         self.progress_bar.setVisible(False)
         self.test_button.setEnabled(True)
+        self.single_probe_radio.setEnabled(True)
+        self.session_probe_radio.setEnabled(True)
 
         fastest = None
         min_delay = float('inf')
-        for name, url, delay in self.delays:
-            if delay > 0 and delay < min_delay:
-                min_delay = delay
-                fastest = name
+        ranked = [item for item in self.delays if self.rank_key(item) < float('inf')]
+        if ranked:
+            fastest, _, min_delay = min(ranked, key=self.rank_key)
 
         if fastest:
-            self.fastest_label.setText(f"最快的镜像站: {fastest} ({min_delay:.2f} ms)")
+            fastest_text = f"最快的镜像站: {fastest} ({min_delay:.2f} ms)"
+            fast_family = get_faster_family(self.family_results.get(fastest, {}))
+            if fast_family is not None:
+                fastest_text += f"\n注意: 默认连接路径较慢，使用{FAMILY_NAMES[fast_family]}会更快"
+            self.fastest_label.setText(fastest_text)
             if fastest in self.single_mirror_buttons:
                 self.single_mirror_buttons[fastest][0].setChecked(True)
 
@@ -395,7 +855,7 @@ class PipSourceManager(QMainWindow):
             if item.widget():
                 item.widget().deleteLater()
         
-        sorted_mirrors = sorted(self.delays, key=lambda x: x[2] if x[2] > 0 else float('inf'))
+        sorted_mirrors = sorted(self.delays, key=self.rank_key)
         for name, url, delay in sorted_mirrors:
             radio = QRadioButton(f"{name}")
             if delay <= 0:
@@ -421,7 +881,7 @@ class PipSourceManager(QMainWindow):
             if item.widget():
                 item.widget().deleteLater()
         
-        sorted_mirrors = sorted(self.delays, key=lambda x: x[2] if x[2] > 0 else float('inf'))
+        sorted_mirrors = sorted(self.delays, key=self.rank_key)
         for name, url, delay in sorted_mirrors:
             checkbox = QCheckBox(f"{name}")
             checkbox.setEnabled(delay > 0)
@@ -439,6 +899,38 @@ class PipSourceManager(QMainWindow):
             self.multi_mirror_checkboxes[name] = (checkbox, url)
             multi_layout.addWidget(checkbox)
 
+    def match_mirror_url(self, url):
+        """根据源地址查找镜像站，返回(名称, 专用地址族)，普通地址的地址族为None，未知源返回(None, None)"""
+        url = url.strip().rstrip("/")
+        for name, mirror_url in self.mirrors.items():
+            if url == mirror_url.strip().rstrip("/"):
+                return name, None
+        for name, family_urls in FAMILY_MIRRORS.items():
+            for family, family_url in family_urls.items():
+                if url == family_url.rstrip("/"):
+                    return name, family
+        return None, None
+
+    def mirror_name_for_url(self, url):
+        """根据源地址查找镜像站名称，包括单一地址族专用域名"""
+        name, family = self.match_mirror_url(url)
+        if name is None:
+            return "未知源"
+        if family is not None:
+            return f"{name}（{FAMILY_NAMES[family]}专用）"
+        return name
+
+    def family_url_for(self, name, url, family_results, preferred_family=None):
+        """返回镜像站实际应写入配置的地址：family_results显示默认地址族较慢时使用更快地址族的专用域名，
+        否则在preferred_family测得可用时沿用该地址族，其余情况使用普通地址"""
+        family_result = family_results.get(name, {})
+        family = get_faster_family(family_result)
+        if family is None and preferred_family is not None:
+            delay = family_result.get(preferred_family)
+            if delay is not None and delay > 0:
+                family = preferred_family
+        return FAMILY_MIRRORS.get(name, {}).get(family, url)
+
     def detect_current_settings(self):
         """检测当前的pip源设置"""
         try:
@@ -454,14 +946,12 @@ class PipSourceManager(QMainWindow):
                 if "global" in config:
                     if "index-url" in config["global"]:
                         current_url = config["global"]["index-url"].strip()
-                        source_name = "未知源"
-                        for name, url in self.mirrors.items():
-                            if current_url == url.strip():
-                                source_name = name
-                                break
+                        source_name = self.mirror_name_for_url(current_url)
                         settings_text += f"主源: {source_name} - {current_url}\n"
-                        if source_name in self.single_mirror_buttons:
-                            self.single_mirror_buttons[source_name][0].setChecked(True)
+                        # 单一地址族专用域名也选中对应镜像站的按钮
+                        mirror_name, _ = self.match_mirror_url(current_url)
+                        if mirror_name in self.single_mirror_buttons:
+                            self.single_mirror_buttons[mirror_name][0].setChecked(True)
 
                     if "extra-index-url" in config["global"]:
                         extra_urls = config["global"]["extra-index-url"].splitlines()
@@ -470,11 +960,7 @@ class PipSourceManager(QMainWindow):
                             for url in extra_urls:
                                 url = url.strip()
                                 if url:
-                                    source_name = "未知源"
-                                    for name, u in self.mirrors.items():
-                                        if url == u.strip():
-                                            source_name = name
-                                            break
+                                    source_name = self.mirror_name_for_url(url)
                                     settings_text += f"- {source_name} - {url}\n"
                             self.multi_radio.setChecked(True)
                             self.on_mode_changed()
@@ -505,6 +991,7 @@ class PipSourceManager(QMainWindow):
                     self.show_large_button_message("警告", "请选择一个镜像站", QMessageBox.Warning)
                     return
 
+                selected_url = self.avoid_slow_family(selected_name, selected_url)
                 self.update_pip_config(selected_url)
                 self.show_large_button_message("成功",
                                       f"已将pip源设置为: {selected_name}\n"
@@ -515,7 +1002,7 @@ class PipSourceManager(QMainWindow):
                 selected_names = []
                 for name, (checkbox, url) in self.multi_mirror_checkboxes.items():
                     if checkbox.isChecked():
-                        selected_mirrors.append(url)
+                        selected_mirrors.append(self.avoid_slow_family(name, url))
                         selected_names.append(name)
                 
                 if not selected_mirrors:
@@ -537,6 +1024,34 @@ class PipSourceManager(QMainWindow):
         except Exception as e:
             self.show_large_button_message("错误", f"设置pip源时出错: {str(e)}", QMessageBox.Critical)
 
+    def avoid_slow_family(self, name, url):
+        """镜像站默认走较慢的地址族时，询问是否改用更快地址族的专用域名，返回最终使用的地址"""
+        fast_family = get_faster_family(self.family_results.get(name, {}))
+        if fast_family is None:
+            return url
+
+        family_result = self.family_results[name]
+        default_name = FAMILY_NAMES[family_result["default"]]
+        fast_name = FAMILY_NAMES[fast_family]
+        family_url = FAMILY_MIRRORS.get(name, {}).get(fast_family)
+        if family_url is None:
+            # pip本身不支持指定地址族，只能提示用户调整系统的地址选择策略
+            self.show_large_button_message(
+                "提示",
+                f"{name} 默认通过{default_name}连接，但{fast_name}更快。\n"
+                f"该镜像站没有{fast_name}专用域名，pip也无法指定地址族，"
+                f"如需绕开慢路径，请在系统中设置优先使用{fast_name}"
+                f"（Linux可修改 /etc/gai.conf）。",
+                QMessageBox.Warning)
+            return url
+
+        if self.ask_large_button_question(
+                "地址族选择",
+                f"{name} 默认通过{default_name}连接，但{fast_name}更快。\n"
+                f"是否改用{fast_name}专用地址？\n{family_url}"):
+            return family_url
+        return url
+
     def update_pip_config(self, primary_url, extra_urls=None):
         """更新pip配置文件"""
         pip_dir = os.path.dirname(self.pip_config_path)
@@ -574,6 +1089,239 @@ class PipSourceManager(QMainWindow):
         with open(self.pip_config_path, "w", encoding="utf-8") as f:
             f.write(config_content)
 
+    def get_current_index_urls(self):
+        """读取当前pip配置中的主源和额外源，未配置时返回pip默认源"""
+        primary_url = DEFAULT_INDEX_URL
+        extra_urls = []
+        if os.path.exists(self.pip_config_path):
+            config = configparser.ConfigParser()
+            config.read(self.pip_config_path, encoding="utf-8")
+            if "global" in config:
+                primary_url = config["global"].get("index-url", primary_url).strip()
+                extra_urls = [url.strip() for url in
+                              config["global"].get("extra-index-url", "").splitlines() if url.strip()]
+        return primary_url, extra_urls
+
+    def toggle_tray_mode(self):
+        """启动或停止后台托盘模式"""
+        if self.agent_running:
+            self.stop_tray_mode()
+        else:
+            self.start_tray_mode()
+
+    def start_tray_mode(self):
+        """启动后台托盘模式：定时及网络切换时重新测速，并按需自动切换pip源"""
+        if not QSystemTrayIcon.isSystemTrayAvailable():
+            self.show_large_button_message("错误", "当前系统不支持系统托盘", QMessageBox.Critical)
+            return
+
+        self.agent_settings = {
+            "interval_minutes": self.agent_interval_spin.value(),
+            "margin_percent": self.agent_margin_spin.value(),
+            "rounds": self.agent_rounds_spin.value(),
+        }
+        try:
+            save_agent_settings(self.agent_settings)
+        except OSError as e:
+            self.statusBar().showMessage(f"保存后台模式设置时出错: {str(e)}")
+
+        if self.tray_icon is None:
+            icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "1.ico")
+            icon = QIcon(icon_path)
+            if icon.isNull():
+                icon = self.style().standardIcon(QStyle.SP_ComputerIcon)
+            self.tray_icon = QSystemTrayIcon(icon, self)
+            self.tray_icon.activated.connect(self.on_tray_activated)
+
+            tray_menu = QMenu(self)
+            show_action = QAction("显示主窗口", self)
+            show_action.triggered.connect(self.show_main_window)
+            probe_action = QAction("立即测速", self)
+            probe_action.triggered.connect(lambda: self.agent_request_probe("手动测速", force=True))
+            stop_action = QAction("停止后台模式", self)
+            stop_action.triggered.connect(self.stop_tray_mode)
+            quit_action = QAction("退出", self)
+            quit_action.triggered.connect(self.quit_app)
+            for action in [show_action, probe_action, stop_action, quit_action]:
+                tray_menu.addAction(action)
+            self.tray_icon.setContextMenu(tray_menu)
+
+        self.agent_running = True
+        self.agent_bad_rounds = 0
+        self.agent_network = get_network_fingerprint()
+        self.tray_icon.setToolTip("PIP源管理工具 - 后台运行中")
+        self.tray_icon.show()
+        QApplication.instance().setQuitOnLastWindowClosed(False)
+        self.agent_button.setText("停止后台托盘模式")
+        self.agent_timer.start(AGENT_TICK_SECONDS * 1000)
+        self.statusBar().showMessage("后台托盘模式已启动")
+        # 最小化到托盘，需要时可从托盘菜单恢复窗口
+        if self.isVisible():
+            self.hide()
+            self.tray_icon.showMessage("PIP源管理工具", "已最小化到托盘，将在后台自动测速和切换pip源",
+                                       QSystemTrayIcon.Information, 3000)
+        self.agent_request_probe("启动")
+
+    def stop_tray_mode(self):
+        """停止后台托盘模式"""
+        self.agent_running = False
+        self.agent_pending_reason = None
+        self.agent_timer.stop()
+        if self.tray_icon is not None:
+            self.tray_icon.hide()
+        QApplication.instance().setQuitOnLastWindowClosed(True)
+        self.agent_button.setText("启动后台托盘模式")
+        self.statusBar().showMessage("后台托盘模式已停止")
+        self.show_main_window()
+
+    def show_main_window(self):
+        """从托盘恢复主窗口"""
+        self.showNormal()
+        self.activateWindow()
+
+    def on_tray_activated(self, reason):
+        """双击托盘图标时显示主窗口"""
+        if reason == QSystemTrayIcon.DoubleClick:
+            self.show_main_window()
+
+    def quit_app(self):
+        """退出程序"""
+        self.agent_running = False
+        self.agent_timer.stop()
+        if self.tray_icon is not None:
+            self.tray_icon.hide()
+        QApplication.instance().quit()
+
+    def closeEvent(self, event):
+        """后台模式下关闭窗口只隐藏到托盘"""
+        if self.agent_running:
+            event.ignore()
+            self.hide()
+            self.tray_icon.showMessage("PIP源管理工具", "程序仍在后台运行，可从托盘图标恢复窗口",
+                                       QSystemTrayIcon.Information, 3000)
+        else:
+            super().closeEvent(event)
+
+    def agent_tick(self):
+        """定时检查：网络变化或到达测速间隔时发起测速，空闲时只读取少量系统文件"""
+        network = get_network_fingerprint()
+        if network != self.agent_network:
+            self.agent_network = network
+            self.agent_bad_rounds = 0  # 网络已变化，之前的比较结果不再适用
+            self.agent_request_probe("网络变化")
+        elif self.agent_pending_reason:
+            self.agent_request_probe(self.agent_pending_reason)
+        elif self.agent_bad_rounds > 0:
+            # 当前源已出现问题：按最小测速间隔连续复测，尽快确认是否需要切换
+            self.agent_request_probe("确认切换")
+        elif time.time() - self.agent_last_probe >= self.agent_settings["interval_minutes"] * 60:
+            self.agent_request_probe("定时测速")
+
+    def agent_request_probe(self, reason, force=False):
+        """请求一次后台测速，距离上次测速过近时推迟到允许的时间；force为True(用户手动请求)时不受频率限制"""
+        if not self.agent_running:
+            return
+        if self.agent_probing:
+            if force:
+                self.tray_icon.showMessage("PIP源管理工具", "测速正在进行中，完成后会自动更新结果",
+                                           QSystemTrayIcon.Information, 3000)
+            return
+        if not force and time.time() - self.agent_last_probe < AGENT_MIN_PROBE_GAP:
+            self.agent_pending_reason = reason
+            return
+
+        self.agent_pending_reason = None
+        self.agent_probing = True
+        self.agent_last_probe = time.time()
+        self.agent_delays = []
+        self.agent_family_results = {}
+        self.agent_probe_network = self.agent_network
+        try:
+            self.passive_stats = load_passive_stats()
+        except OSError:
+            pass
+
+        # 配置中是单一地址族专用域名时同时探测该地址，按pip实际使用的地址判断健康状况
+        probe_mirrors = dict(self.mirrors)
+        current_url, _ = self.get_current_index_urls()
+        if self.match_mirror_url(current_url)[1] is not None:
+            probe_mirrors[self.mirror_name_for_url(current_url)] = current_url
+
+        self.tray_icon.setToolTip(f"PIP源管理工具 - 测速中（{reason}）")
+        self.agent_thread = PingThread(probe_mirrors, per_family=True)
+        self.agent_thread.family_signal.connect(self.agent_update_family_result)
+        self.agent_thread.update_signal.connect(
+            lambda name, url, delay: self.agent_delays.append((name, url, delay)))
+        self.agent_thread.finish_signal.connect(self.agent_round_finished)
+        self.agent_thread.start()
+
+    def agent_update_family_result(self, name, family_result):
+        """保存后台测速中单个镜像站的IPv4/IPv6结果"""
+        self.agent_family_results[name] = family_result
+
+    def agent_round_finished(self):
+        """一轮后台测速完成：当前源连续多轮不健康或被明显超越时才切换，避免来回抖动"""
+        self.agent_probing = False
+        if not self.agent_running:
+            return
+        if self.agent_probe_network != self.agent_network:
+            # 测速期间网络发生了变化，本轮结果不再适用
+            self.agent_pending_reason = "网络变化"
+            return
+
+        current_url, extra_urls = self.get_current_index_urls()
+        current_name, current_family = self.match_mirror_url(current_url)
+        current = None
+        for item in self.agent_delays:
+            if item[1].rstrip("/") == current_url.rstrip("/"):
+                current = item
+        # 候选源只从镜像站列表中选，是否使用单一地址族专用域名由本轮的分地址族结果决定
+        ranked = [item for item in self.agent_delays
+                  if item[0] in self.mirrors and self.rank_key(item) < float('inf')]
+        best = min(ranked, key=self.rank_key) if ranked else None
+
+        if current_name is None or current is None:
+            # 当前使用的是列表之外的自定义源，不做自动切换
+            self.tray_icon.setToolTip("PIP源管理工具 - 当前为自定义源，不自动切换")
+            return
+        if best is None:
+            self.tray_icon.setToolTip("PIP源管理工具 - 无法连接到任何镜像站")
+            return
+
+        current_score = self.rank_key(current)
+        best_score = self.rank_key(best)
+        margin = self.agent_settings["margin_percent"] / 100
+        unhealthy = current_score == float('inf')
+        beaten = best_score < current_score * (1 - margin)
+        # 保留用户选择的地址族，或避开本轮测得的慢地址族；地址族不可用时改用普通地址
+        best_url = self.family_url_for(best[0], best[1], self.agent_family_results, current_family)
+        if best_url.rstrip("/") != current_url.rstrip("/") and (unhealthy or beaten):
+            self.agent_bad_rounds += 1
+        else:
+            self.agent_bad_rounds = 0
+
+        current_display = self.mirror_name_for_url(current_url)
+        if self.agent_bad_rounds < self.agent_settings["rounds"]:
+            status = "不健康" if unhealthy else f"{current_score:.0f} ms"
+            self.tray_icon.setToolTip(f"PIP源管理工具 - 当前源: {current_display}（{status}）"
+                                      f"\n待切换轮数: {self.agent_bad_rounds}/{self.agent_settings['rounds']}")
+            return
+
+        try:
+            extra_urls = [url for url in extra_urls if self.match_mirror_url(url)[0] != best[0]]
+            self.update_pip_config(best_url, extra_urls)
+        except Exception as e:
+            self.tray_icon.showMessage("PIP源管理工具", f"自动切换pip源时出错: {str(e)}",
+                                       QSystemTrayIcon.Critical, 5000)
+            return
+        self.agent_bad_rounds = 0
+        best_display = self.mirror_name_for_url(best_url)
+        reason = "当前源无法连接" if unhealthy else f"{best[0]} 比当前源快 {1 - best_score / current_score:.0%}"
+        self.tray_icon.setToolTip(f"PIP源管理工具 - 当前源: {best_display}（{best_score:.0f} ms）")
+        self.tray_icon.showMessage("PIP源管理工具", f"已自动切换pip源: {current_display} → {best_display}\n{reason}",
+                                   QSystemTrayIcon.Information, 5000)
+        self.detect_current_settings()
+
     def reset_settings(self):
         """恢复默认设置（删除配置文件）"""
         try:
@@ -635,6 +1383,24 @@ class PipSourceManager(QMainWindow):
         
         msg.exec_()
 
+    def ask_large_button_question(self, title, message):
+        """显示带有大按钮的是/否询问框，选择"是"时返回True"""
+        msg = QMessageBox()
+        msg.setWindowTitle(title)
+        msg.setIcon(QMessageBox.Question)
+        msg.setText(message)
+        msg.setMinimumWidth(400)
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        msg.setDefaultButton(QMessageBox.Yes)
+
+        for btn, text in [(msg.button(QMessageBox.Yes), "是"), (msg.button(QMessageBox.No), "否")]:
+            btn.setText(text)
+            btn.setMinimumHeight(45)
+            btn.setMinimumWidth(120)
+            btn.setFont(QFont("SimHei", 12, QFont.Bold))
+
+        return msg.exec_() == QMessageBox.Yes
+
     def apply_styles(self):
         """应用样式表"""
         self.setStyleSheet("""
@@ -726,7 +1492,13 @@ if __name__ == "__main__":
     app.setFont(font)
     
     window = PipSourceManager()
-    window.show()
+    # python main.py --tray：直接以后台托盘模式启动
+    if "--tray" in sys.argv[1:]:
+        window.start_tray_mode()
+        if not window.agent_running:
+            window.show()
+    else:
+        window.show()
     
     sys.exit(app.exec_())
     
\ No newline at end of file
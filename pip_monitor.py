@@ -0,0 +1,185 @@
+"""被动测速：包装真实的pip命令，记录每个网络请求的耗时，供镜像站排序使用
+
+本模块只依赖标准库和pip自身，不需要安装PyQt5，用法：
+    python pip_monitor.py install requests
+"""
+import sys
+import os
+import time
+import json
+import statistics
+import tempfile
+from urllib.parse import urlparse
+
+# 本地数据目录，用于保存被动测速记录
+STORE_DIR = os.path.join(os.path.expanduser("~"), ".pip_acceleration")
+PASSIVE_LOG_PATH = os.path.join(STORE_DIR, "passive_requests.jsonl")
+PASSIVE_MAX_RECORDS = 20000  # 清理记录文件后保留的条数
+PASSIVE_MAX_BYTES = 8 * 1024 * 1024  # 记录文件超过该大小时才清理旧记录
+PASSIVE_MAX_AGE_DAYS = 7  # 参与排序的被动记录最长有效期(天)
+PASSIVE_MIN_SAMPLES = 5  # 被动记录数达到该值才参与排序
+
+
+def save_passive_records(records):
+    """将被动测速记录追加到本地记录文件，文件过大时只保留最新的记录"""
+    if not records:
+        return
+    os.makedirs(STORE_DIR, exist_ok=True)
+    # 以追加方式一次写入，多个pip进程同时运行时不会互相覆盖记录
+    content = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    with open(PASSIVE_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(content)
+    if os.path.getsize(PASSIVE_LOG_PATH) > PASSIVE_MAX_BYTES:
+        trim_passive_records()
+
+
+def trim_passive_records():
+    """只保留最新的PASSIVE_MAX_RECORDS条记录，先写入临时文件再原子替换"""
+    with open(PASSIVE_LOG_PATH, "r", encoding="utf-8") as f:
+        lines = f.readlines()[-PASSIVE_MAX_RECORDS:]
+    fd, temp_path = tempfile.mkstemp(dir=STORE_DIR, prefix="passive_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(temp_path, PASSIVE_LOG_PATH)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+
+def is_number(value):
+    """判断是否为数值(不包括布尔值)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_valid_passive_record(record):
+    """检查被动记录的结构，缺少主机或时间字段不是数值的记录不参与统计"""
+    return (isinstance(record, dict)
+            and isinstance(record.get("host"), str)
+            and all(is_number(record.get(key)) for key in ("time", "ttfb", "total")))
+
+
+def is_passive_error(record):
+    """判断被动记录是否为失败请求：只有连接异常和5xx算失败，4xx(如镜像站没有该项目时的404)是正常应答"""
+    status = record.get("status")
+    if isinstance(status, int):
+        return status >= 500
+    error = record.get("error")
+    # 兼容旧记录：旧版本把所有>=400的状态码都写在error字段中
+    if isinstance(error, str) and error.startswith("HTTP 4"):
+        return False
+    return bool(error)
+
+
+def load_passive_stats(max_age_days=PASSIVE_MAX_AGE_DAYS):
+    """读取被动测速记录，按主机汇总请求数、错误率、首字节时间和总耗时的中位数"""
+    if not os.path.exists(PASSIVE_LOG_PATH):
+        return {}
+    oldest = time.time() - max_age_days * 86400
+    grouped = {}
+    with open(PASSIVE_LOG_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 跳过损坏的行
+            if not is_valid_passive_record(record):
+                continue  # 跳过格式不正确的记录
+            if record["time"] < oldest or not record["host"]:
+                continue
+            grouped.setdefault(record["host"], []).append(record)
+
+    stats = {}
+    for host, records in grouped.items():
+        ok = [r for r in records if not is_passive_error(r)]
+        stats[host] = {
+            "count": len(records),
+            "error_rate": (len(records) - len(ok)) / len(records),
+            "ttfb": statistics.median(r["ttfb"] for r in ok) if ok else -1,
+            "total": statistics.median(r["total"] for r in ok) if ok else -1,
+            "bytes": sum(r["bytes"] for r in records if is_number(r.get("bytes"))),
+        }
+    return stats
+
+
+def run_instrumented_pip(pip_args):
+    """运行真实的pip命令，同时记录每个网络请求的主机、字节数、首字节时间、总耗时和错误"""
+    try:
+        from pip._internal.cli.main import main as pip_main
+        from pip._vendor.requests.adapters import HTTPAdapter as PipHTTPAdapter
+    except ImportError:
+        print("未找到pip，无法运行被动测速包装器", file=sys.stderr)
+        return 1
+
+    records = []
+    original_send = PipHTTPAdapter.send
+
+    # 在传输适配器层计时：命中pip本地缓存的请求不会到达这里，响应头到达后即返回
+    def instrumented_send(adapter, request, *args, **kwargs):
+        record = {
+            "time": time.time(),
+            "host": urlparse(request.url).hostname or "",
+            "url": request.url,
+            "bytes": 0,
+            "ttfb": -1,
+            "total": -1,
+            "status": None,
+            "error": "",
+        }
+        start_time = time.perf_counter()
+        try:
+            response = original_send(adapter, request, *args, **kwargs)
+        except Exception as e:
+            record["total"] = (time.perf_counter() - start_time) * 1000
+            record["error"] = type(e).__name__
+            records.append(record)
+            raise
+
+        # send返回时已收到响应头，此时的耗时即首字节时间
+        record["ttfb"] = record["total"] = (time.perf_counter() - start_time) * 1000
+        record["status"] = response.status_code
+        if response.status_code >= 500:
+            record["error"] = f"HTTP {response.status_code}"
+        records.append(record)
+
+        def count_body(data):
+            record["bytes"] += len(data or b"")
+            record["total"] = (time.perf_counter() - start_time) * 1000
+
+        # 包装底层的read和read_chunked方法，在读取响应体时累计字节数并更新总耗时
+        # 分块传输(如镜像站实时gzip压缩的页面)的响应由stream()直接调用read_chunked，不经过read
+        raw = response.raw
+        if raw is not None and hasattr(raw, "read"):
+            original_read = raw.read
+
+            def counting_read(*args, **kw):
+                data = original_read(*args, **kw)
+                count_body(data)
+                return data
+
+            raw.read = counting_read
+        if raw is not None and hasattr(raw, "read_chunked"):
+            original_read_chunked = raw.read_chunked
+
+            def counting_read_chunked(*args, **kw):
+                for chunk in original_read_chunked(*args, **kw):
+                    count_body(chunk)
+                    yield chunk
+
+            raw.read_chunked = counting_read_chunked
+        return response
+
+    PipHTTPAdapter.send = instrumented_send
+    try:
+        return pip_main(list(pip_args))
+    finally:
+        PipHTTPAdapter.send = original_send
+        try:
+            save_passive_records([r for r in records if r["host"]])
+        except OSError as e:
+            print(f"保存被动测速记录时出错: {str(e)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # 参数原样传给pip，pip安装到运行本脚本的Python解释器(sys.executable)所在的环境
+    sys.exit(run_instrumented_pip(sys.argv[1:]))